@@ -1,17 +1,49 @@
 import os
+import logging
+from contextlib import asynccontextmanager
 import httpx # Para hacer solicitudes HTTP asíncronas
-from fastapi import FastAPI, Body, HTTPException, status
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv # Para cargar variables de .env en desarrollo local
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from dotenv import find_dotenv, load_dotenv # Para cargar variables de .env en desarrollo local
 
 # Cargar variables de entorno desde un archivo .env si existe (para desarrollo local)
-# En Render, estas variables se configuran directamente en el dashboard.
-load_dotenv()
+# En Render, estas variables se configuran directamente en el dashboard; define
+# LOAD_DOTENV=0 allí para no buscar ni parsear ningún .env al arrancar.
+# find_dotenv() busca hacia arriba desde la carpeta de este archivo, igual que load_dotenv().
+_DOTENV_PATH = find_dotenv() if os.getenv("LOAD_DOTENV", "1") == "1" else ""
+if _DOTENV_PATH:
+    load_dotenv(_DOTENV_PATH)
+
+# --- Logging ---
+# Se configura una sola vez al arrancar. En producción basta con INFO; usa LOG_LEVEL=DEBUG
+# para ver los diagnósticos detallados del intercambio de tokens.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+log = logging.getLogger("winnerphoto.auth")
+
+# --- Ciclo de vida de la aplicación ---
+# Un único cliente HTTP compartido por todas las solicitudes: reutiliza las conexiones
+# (keep-alive) con Google en lugar de abrir una conexión TCP+TLS nueva en cada intercambio.
+# Con HTTP/2 las solicitudes concurrentes se multiplexan sobre una misma conexión.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60),
+    )
+    yield
+    await app.state.http.aclose()
 
 app = FastAPI(
     title="WinnerPhoto Backend Auth",
     description="Servicio de backend para manejar la autenticación de Google OAuth2.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Configuración de CORS ---
@@ -28,8 +60,9 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,       # Orígenes permitidos
     allow_credentials=True,      # Permitir cookies (si las usaras en el futuro)
-    allow_methods=["*"],         # Permitir todos los métodos (GET, POST, etc.)
-    allow_headers=["*"],         # Permitir todas las cabeceras
+    allow_methods=["GET", "POST", "OPTIONS"],           # Solo los métodos que usa el frontend
+    allow_headers=["Authorization", "Content-Type"],    # Cabeceras explícitas: comprobación por conjunto, sin reflejar
+    max_age=86400,               # El navegador cachea el preflight (OPTIONS) hasta un día (Chrome lo limita a 2 h)
 )
 
 # --- Configuración de Google OAuth2 (leída de variables de entorno) ---
@@ -43,27 +76,64 @@ GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI_BACKEND") # ej: "https://de
 
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token" # Endpoint de Google para intercambiar el código por tokens
 
+# Parte fija del cuerpo de la solicitud de tokens; en cada petición solo se añade el "code".
+_TOKEN_PAYLOAD_BASE = {
+    "client_id": GOOGLE_CLIENT_ID,
+    "client_secret": GOOGLE_CLIENT_SECRET,
+    "redirect_uri": GOOGLE_REDIRECT_URI,
+    "grant_type": "authorization_code",
+    # "access_type": "offline" # Puedes añadir esto explícitamente si quieres asegurar
+                             # la solicitud de un refresh_token, aunque a menudo se infiere.
+                             # Google solo devuelve refresh_token en la primera autorización.
+}
+
 # --- Verificación de variables de entorno al inicio ---
-if not all([GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI]):
-    print("ALERTA CRÍTICA DE CONFIGURACIÓN:")
-    print("Una o más variables de entorno de Google no están configuradas correctamente en el backend.")
-    print(f"  GOOGLE_CLIENT_ID_BACKEND: {'Configurado' if GOOGLE_CLIENT_ID else 'NO CONFIGURADO'}")
-    print(f"  GOOGLE_CLIENT_SECRET_BACKEND: {'Configurado (longitud: ' + str(len(GOOGLE_CLIENT_SECRET)) + ')' if GOOGLE_CLIENT_SECRET else 'NO CONFIGURADO'}")
-    print(f"  GOOGLE_REDIRECT_URI_BACKEND: {GOOGLE_REDIRECT_URI if GOOGLE_REDIRECT_URI else 'NO CONFIGURADO'}")
-    # En un entorno de producción, podrías querer que la aplicación no inicie si faltan estas.
+# La configuración no cambia tras arrancar, así que se valida una sola vez aquí; el endpoint
+# solo consulta el booleano resultante.
+_GOOGLE_CONFIG_OK = bool(GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET and GOOGLE_REDIRECT_URI)
+if not _GOOGLE_CONFIG_OK:
+    log.critical("ALERTA CRÍTICA DE CONFIGURACIÓN:")
+    log.critical("Una o más variables de entorno de Google no están configuradas correctamente en el backend.")
+    log.critical("  GOOGLE_CLIENT_ID_BACKEND: %s", 'Configurado' if GOOGLE_CLIENT_ID else 'NO CONFIGURADO')
+    log.critical("  GOOGLE_CLIENT_SECRET_BACKEND: %s", f"Configurado (longitud: {len(GOOGLE_CLIENT_SECRET)})" if GOOGLE_CLIENT_SECRET else 'NO CONFIGURADO')
+    log.critical("  GOOGLE_REDIRECT_URI_BACKEND: %s", GOOGLE_REDIRECT_URI if GOOGLE_REDIRECT_URI else 'NO CONFIGURADO')
     # Para Render, asegúrate de haberlas establecido en la sección "Environment" de tu servicio.
+    # Define REQUIRE_GOOGLE_CONFIG=0 solo si necesitas arrancar sin ellas (p. ej. para ver /docs).
+    if os.getenv("REQUIRE_GOOGLE_CONFIG", "1") == "1":
+        raise RuntimeError("Faltan variables de entorno de Google OAuth2; el backend no puede iniciar.")
+
+# --- Modelos de datos ---
+class GoogleAuthRequest(BaseModel):
+    """Cuerpo JSON que envía el frontend tras el login con Google."""
+    code: str = Field(min_length=1, examples=["auth_code_del_frontend"])
+
+class TokenResponse(BaseModel):
+    """Tokens que se devuelven al frontend. Nunca incluye el refresh_token."""
+    model_config = {"extra": "ignore"}
+
+    access_token: str
+    id_token: str
+    message: str
 
 # --- Endpoint Raíz (para verificar que el servicio está vivo) ---
+# Lo consultan con frecuencia los chequeos de salud de Render, así que la respuesta se
+# construye una sola vez al arrancar (cuerpo JSON ya en bytes) y se reutiliza tal cual.
+_ROOT_RESPONSE = Response(
+    content=b'{"mensaje":"Bienvenido al backend seguro de WinnerPhoto v1.0"}',
+    media_type="application/json"
+)
+
 @app.get("/", summary="Endpoint de Bienvenida", tags=["General"])
 async def read_root():
     """
     Endpoint simple para verificar que el backend está funcionando.
     """
-    return {"mensaje": "Bienvenido al backend seguro de WinnerPhoto v1.0"}
+    return _ROOT_RESPONSE
 
 # --- Endpoint para el Callback de Google OAuth2 ---
-@app.post("/auth/google", summary="Intercambia código de Google por tokens", tags=["Autenticación"])
-async def google_auth_exchange(request_data: dict = Body(..., example={"code": "auth_code_del_frontend"})):
+@app.post("/auth/google", summary="Intercambia código de Google por tokens", tags=["Autenticación"],
+          response_model=TokenResponse, response_model_exclude_none=True)
+async def google_auth_exchange(request_data: GoogleAuthRequest):
     """
     Recibe un código de autorización de Google (`authCode`) del frontend,
     lo intercambia con Google por un `access_token`, `id_token` y (si aplica)
@@ -71,98 +141,90 @@ async def google_auth_exchange(request_data: dict = Body(..., example={"code": "
     Devuelve `access_token` e `id_token` al frontend.
     El `refresh_token` debe ser manejado y almacenado de forma segura por este backend.
     """
-    auth_code = request_data.get("code")
+    auth_code = request_data.code # FastAPI ya devuelve 422 si falta o está vacío
 
-    if not auth_code:
+    if not _GOOGLE_CONFIG_OK: # Solo posible si se arrancó con REQUIRE_GOOGLE_CONFIG=0
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, 
-            detail="El código de autorización ('code') es requerido en el cuerpo JSON."
-        )
-
-    if not all([GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI]):
-         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, # O 500 Internal Server Error
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Error de configuración del servidor: Las credenciales de Google no están completas en el backend."
         )
 
-    print(f"Backend: Código de autorización recibido (primeros 20 chars): {auth_code[:20]}...")
-
-    token_request_payload = {
-        "code": auth_code,
-        "client_id": GOOGLE_CLIENT_ID,
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "grant_type": "authorization_code",
-        # "access_type": "offline" # Puedes añadir esto explícitamente si quieres asegurar
-                                 # la solicitud de un refresh_token, aunque a menudo se infiere.
-                                 # Google solo devuelve refresh_token en la primera autorización.
-    }
+    log.debug("Código de autorización recibido (longitud: %d)", len(auth_code))
+
+    token_request_payload = {**_TOKEN_PAYLOAD_BASE, "code": auth_code}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Backend: Solicitando tokens a Google en: {GOOGLE_TOKEN_URL}")
-            response = await client.post(GOOGLE_TOKEN_URL, data=token_request_payload)
-            response.raise_for_status()  # Lanza una excepción para errores HTTP 4xx/5xx de Google
-            
-            tokens = response.json()
-            print(f"Backend: Respuesta de tokens recibida de Google: { {k: (v[:20] + '...' if isinstance(v, str) and len(v) > 20 else v) for k, v in tokens.items()} }") # Logueo seguro de tokens
-
-            access_token = tokens.get("access_token")
-            id_token = tokens.get("id_token")
-            refresh_token = tokens.get("refresh_token") # ¡ESTE ES EL IMPORTANTE PARA TI!
-
-            if not access_token or not id_token:
-                print(f"Backend Error: Respuesta incompleta de Google al solicitar token: {tokens}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                    detail="Respuesta de token incompleta de Google."
-                )
-
-            if refresh_token:
-                # ¡¡¡ACCIÓN CRUCIAL!!!
-                # Aquí es donde debes almacenar el refresh_token de forma SEGURA.
-                # Por ejemplo, en una base de datos, encriptado, y asociado con
-                # la identidad del usuario (que puedes obtener del 'sub' claim del id_token).
-                print(f"Backend: ¡REFRESH TOKEN RECIBIDO! (primeros 20 chars): {refresh_token[:20]}...")
-                print("TODO: Implementar almacenamiento seguro del refresh_token aquí.")
-                # Ejemplo (conceptual, necesitarías una DB real):
-                # user_google_id = decode_id_token(id_token).get('sub')
-                # store_refresh_token_for_user(user_google_id, refresh_token)
-            
-            else:
-                print("Backend: No se recibió un refresh_token de Google esta vez (puede ser normal si no es la primera autorización).")
-
-
-            # Devolver los tokens que el frontend necesita para operar.
-            # NUNCA devuelvas el refresh_token al frontend.
-            return {
-                "access_token": access_token,
-                "id_token": id_token,
-                "message": "Tokens obtenidos exitosamente desde el backend."
-            }
-
-        except httpx.HTTPStatusError as e:
-            # Error al comunicarse con el servidor de Google
-            error_response_text = e.response.text
-            try:
-                error_details_google = e.response.json() 
-                error_description_google = error_details_google.get('error_description', error_details_google.get('error', error_response_text))
-            except Exception:
-                error_description_google = error_response_text
-            
-            print(f"Backend Error: Error HTTP de Google al intercambiar código: {e.response.status_code} - {error_description_google}")
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY, # Indica que tu servidor actuó como gateway y recibió una respuesta inválida
-                detail=f"Error al comunicarse con el servicio de autenticación de Google: {error_description_google}"
-            )
-        except Exception as e:
-            # Otros errores inesperados
-            print(f"Backend Error: Error inesperado durante el intercambio de código: {str(e)}")
+    client = app.state.http
+    try:
+        log.debug("Solicitando tokens a Google en: %s", GOOGLE_TOKEN_URL)
+        response = await client.post(GOOGLE_TOKEN_URL, data=token_request_payload)
+        response.raise_for_status()  # Lanza una excepción para errores HTTP 4xx/5xx de Google
+        
+        tokens = response.json()
+        log.debug("Respuesta de tokens recibida de Google: campos=%s refresh_token=%s", list(tokens), "refresh_token" in tokens) # Sin valores de tokens en el log
+
+        access_token = tokens.get("access_token")
+        id_token = tokens.get("id_token")
+        refresh_token = tokens.get("refresh_token") # ¡ESTE ES EL IMPORTANTE PARA TI!
+
+        if not access_token or not id_token:
+            log.error("Respuesta incompleta de Google al solicitar token (campos recibidos: %s)", list(tokens))
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                detail=f"Error interno del servidor durante la autenticación: {str(e)}"
+                detail="Respuesta de token incompleta de Google."
             )
 
+        if refresh_token:
+            # ¡¡¡ACCIÓN CRUCIAL!!!
+            # Aquí es donde debes almacenar el refresh_token de forma SEGURA.
+            # Por ejemplo, en una base de datos, encriptado, y asociado con
+            # la identidad del usuario (que puedes obtener del 'sub' claim del id_token).
+            log.info("¡REFRESH TOKEN RECIBIDO! (valor no registrado)")
+            log.warning("TODO: Implementar almacenamiento seguro del refresh_token aquí.")
+            # Ejemplo (conceptual, necesitarías una DB real):
+            # user_google_id = decode_id_token(id_token).get('sub')
+            # store_refresh_token_for_user(user_google_id, refresh_token)
+        
+        else:
+            log.info("No se recibió un refresh_token de Google esta vez (puede ser normal si no es la primera autorización).")
+
+
+        # Devolver los tokens que el frontend necesita para operar.
+        # NUNCA devuelvas el refresh_token al frontend.
+        return TokenResponse(
+            access_token=access_token,
+            id_token=id_token,
+            message="Tokens obtenidos exitosamente desde el backend."
+        )
+
+    except httpx.HTTPStatusError as e:
+        # Error al comunicarse con el servidor de Google
+        # Se intenta primero el JSON; el texto plano solo se decodifica si Google no devolvió JSON.
+        try:
+            error_details_google = e.response.json()
+            error_description_google = error_details_google.get('error_description') or error_details_google.get('error') or str(error_details_google)
+        except (ValueError, AttributeError):
+            error_description_google = e.response.text
+        
+        log.error("Error HTTP de Google al intercambiar código: %s - %s", e.response.status_code, error_description_google)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, # Indica que tu servidor actuó como gateway y recibió una respuesta inválida
+            detail=f"Error al comunicarse con el servicio de autenticación de Google: {error_description_google}"
+        )
+    except Exception as e:
+        # Otros errores inesperados
+        log.exception("Error inesperado durante el intercambio de código: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            detail=f"Error interno del servidor durante la autenticación: {str(e)}"
+        )
+
+# --- Servidor ASGI ---
+# uvicorn[standard] (ver requirements.txt) instala uvloop y httptools. Fíjalos explícitamente
+# en el comando de arranque de Render para que un cambio de dependencias no vuelva en
+# silencio al bucle asyncio y al parser h11 en Python puro:
+#     uvicorn main:app --host 0.0.0.0 --port $PORT --loop uvloop --http httptools
+# Con Gunicorn: gunicorn main:app -k uvicorn.workers.UvicornWorker (usa uvloop/httptools si están instalados).
+
 # --- Para ejecutar localmente (si este archivo es main.py): ---
 # Comenta o elimina esto antes de desplegar en algunos entornos que usan Gunicorn o un entrypoint diferente
 # if __name__ == "__main__":
@@ -171,4 +233,4 @@ async def google_auth_exchange(request_data: dict = Body(..., example={"code": "
 #     print(f"  GOOGLE_CLIENT_ID_BACKEND: {'OK' if GOOGLE_CLIENT_ID else 'NO CONFIGURADO'}")
 #     print(f"  GOOGLE_CLIENT_SECRET_BACKEND: {'OK' if GOOGLE_CLIENT_SECRET else 'NO CONFIGURADO'}")
 #     print(f"  GOOGLE_REDIRECT_URI_BACKEND: {GOOGLE_REDIRECT_URI if GOOGLE_REDIRECT_URI else 'NO CONFIGURADO'}")
-#     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+#     uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file